@@ -0,0 +1,202 @@
+import codecs
+import hashlib
+import json
+import os
+import pickle
+import re
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+from urllib.parse import urlparse
+
+from lxml import etree, html as lxml_html
+from urllib3.util.request import ACCEPT_ENCODING
+
+# get-the-data 页面的抓取、解析和缓存，CityList 和 CityDownloader 共用
+INDEX_URL = "https://insideairbnb.com/get-the-data/"
+CACHE_DIR = Path.home() / ".cache" / "iacollector"
+INDEX_TTL = 6 * 60 * 60  # 6 hours
+
+# 抓取页面时请求压缩传输（ACCEPT_ENCODING 只包含本机 urllib3 能解码的格式，如 gzip/deflate/br）
+SESSION_HEADERS = {
+    'Accept-Encoding': ACCEPT_ENCODING,
+    'User-Agent': 'iacollector/1.0'
+}
+
+_META_CHARSET_RE = re.compile(rb'<meta[^>]+charset=["\']?([A-Za-z0-9_-]+)', re.IGNORECASE)
+_ISO_DATE_RE = re.compile(r'\d{4}-\d{2}-\d{2}')
+_DMY_RE = re.compile(r'(\d{1,2})\s+([A-Za-z]+),?\s+(\d{4})')
+_MONTHS = {'january':1, 'february':2, 'march':3, 'april':4, 'may':5, 'june':6,
+           'july':7, 'august':8, 'september':9, 'october':10, 'november':11, 'december':12}
+
+def _parse_dates(text: str) -> List[str]:
+    """Find YYYY-MM-DD and "9 June, 2025" style dates in text"""
+    dates = _ISO_DATE_RE.findall(text)
+    
+    for day, month, year in _DMY_RE.findall(text):
+        month_num = _MONTHS.get(month.lower())
+        if month_num:
+            dates.append(f"{year}-{month_num:02d}-{int(day):02d}")
+    
+    return dates
+
+def _write_atomic(path: Path, data: bytes):
+    """Write bytes to a temp file and rename it over the target"""
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+def _page_encoding(response, content: bytes) -> str:
+    """Pick the page encoding: HTTP charset, then <meta charset>, then UTF-8"""
+    # requests 在 Content-Type 没写 charset 时会默认 ISO-8859-1，所以只采用明确声明的 charset
+    if 'charset' in response.headers.get('Content-Type', '').lower() and response.encoding:
+        return response.encoding
+
+    match = _META_CHARSET_RE.search(content[:4096])
+    if match:
+        try:
+            return codecs.lookup(match.group(1).decode('ascii')).name
+        except LookupError:
+            pass
+    return 'utf-8'
+
+def _fetch_index_html(session, url: str, force: bool = False) -> Tuple[bytes, str]:
+    """Get the get-the-data page and its encoding, served from disk while it is fresh"""
+    html_path = CACHE_DIR / "get_the_data.html"
+    meta_path = CACHE_DIR / "get_the_data.json"
+
+    # 缓存只是尽力而为：HOME 不可读写（容器、CI）时直接请求页面
+    meta = {}
+    try:
+        meta = json.loads(meta_path.read_text())
+        if not force and html_path.stat().st_mtime > time.time() - INDEX_TTL:
+            return html_path.read_bytes(), meta.get('encoding') or 'utf-8'
+    except (OSError, ValueError):
+        pass
+
+    # 过期后带上 ETag / Last-Modified，页面没变时服务器只返回 304
+    headers = {}
+    if meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    if meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+
+    response = session.get(url, headers=headers, timeout=30)
+    if response.status_code == 304:
+        try:
+            html_path.touch()
+            return html_path.read_bytes(), meta.get('encoding') or 'utf-8'
+        except OSError:
+            response = session.get(url, timeout=30)
+    response.raise_for_status()
+
+    encoding = _page_encoding(response, response.content)
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        _write_atomic(html_path, response.content)
+        meta_path.write_text(json.dumps({
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'encoding': encoding
+        }))
+    except OSError:
+        pass
+    return response.content, encoding
+
+def _load_mappings_cached(name: str, session, url: str, parse: Callable[[bytes, str], Dict], force: bool = False) -> Dict:
+    """Parse the index page once per page version and pickle the result"""
+    content, encoding = _fetch_index_html(session, url, force)
+    digest = hashlib.sha1(encoding.encode() + b'\0' + content).hexdigest()
+    pickle_path = CACHE_DIR / f"{name}.pkl"
+
+    try:
+        with open(pickle_path, 'rb') as f:
+            cached_digest, mappings = pickle.load(f)
+        if cached_digest == digest:
+            return mappings
+    except Exception:
+        pass
+
+    mappings = parse(content, encoding)
+    try:
+        _write_atomic(pickle_path, pickle.dumps((digest, mappings)))
+    except OSError:
+        pass
+    return mappings
+
+def _collect_section(header):
+    """Collect data links and text between a city header and the next <h3> in one pass"""
+    links = []
+    texts = [header.tail or '']
+
+    for sibling in header.itersiblings(etree.Element):
+        if sibling.tag == 'h3':
+            break
+
+        links.extend(sibling.xpath('descendant-or-self::a[contains(@href, "data.insideairbnb.com")]/@href'))
+        texts.append(sibling.text_content() + (sibling.tail or ''))
+
+    return links, texts
+
+def _extract_url_path(url: str) -> str:
+    """Extract city path from full URL"""
+    try:
+        parsed = urlparse(url)
+        path_parts = [p for p in parsed.path.split('/') if p]
+
+        if len(path_parts) >= 5 and path_parts[-2] == 'data':
+            return '/'.join(path_parts[:3])
+
+        return None
+    except:
+        return None
+
+def _get_city_folder_name(display_name: str) -> str:
+    """Generate folder name from display name"""
+    city_name = display_name.split(',')[0].strip()
+    return city_name.lower().replace(' ', '_').replace('-', '_')
+
+def _parse_index(content: bytes, encoding: str = 'utf-8') -> Dict[str, Dict]:
+    """Parse every city with a date from the get-the-data page"""
+    # 显式指定编码；页面没有 <meta charset> 时 lxml 会按 latin-1 解码，城市名中的 "Île" 等会乱码
+    tree = lxml_html.fromstring(content, parser=lxml_html.HTMLParser(encoding=encoding))
+    index = {}
+
+    for h3 in tree.iter('h3'):
+        city_display_name = h3.text_content().strip()
+        if any(word in city_display_name.lower() for word in ['get the data', 'archived', 'contact']):
+            continue
+
+        links, texts = _collect_section(h3)
+
+        dates = []
+        for text in texts:
+            dates.extend(_parse_dates(text))
+        if not dates:
+            continue
+
+        # 没有可用下载链接的城市 url_path 为 None，只用于显示
+        url_path = next((path for path in map(_extract_url_path, links) if path), None)
+
+        index[city_display_name] = {
+            'url_path': url_path,
+            'latest_date': max(dates),
+            'city_folder': _get_city_folder_name(city_display_name)
+        }
+
+    return index
+
+_index = None
+_index_loaded_at = 0.0
+
+def get_index(session, force: bool = False) -> Dict[str, Dict]:
+    """Get {display name: {'url_path', 'latest_date', 'city_folder'}} for all cities"""
+    global _index, _index_loaded_at
+
+    # 进程内只抓取、解析一次，citylist() 之后再 citydownload() 不会重复请求
+    if _index is not None and not force and _index_loaded_at > time.time() - INDEX_TTL:
+        return _index
+
+    _index = _load_mappings_cached('city_index', session, INDEX_URL, _parse_index, force)
+    _index_loaded_at = time.time()
+    return _index
@@ -0,0 +1,10 @@
+from psycopg2 import sql
+
+# tosql 和 createhosts 共用：标识符统一用 psycopg2.sql.Identifier 转义，不手写引号规则
+
+def execute_sql(conn, query: sql.Composable) -> int:
+    """Run a psycopg2.sql statement on a SQLAlchemy connection, return the row count"""
+    # 通过底层 psycopg2 连接执行，与 SQLAlchemy 连接处于同一事务
+    with conn.connection.cursor() as cur:
+        cur.execute(query)
+        return cur.rowcount
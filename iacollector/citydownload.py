@@ -1,14 +1,18 @@
+import json
+import os
 import requests
-from bs4 import BeautifulSoup
-import re
+import shutil
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, List, Union
-from urllib.parse import urlparse
+
+from ._index import SESSION_HEADERS, get_index
 
 class CityDownloader:
     def __init__(self):
         self.base_url = "https://data.insideairbnb.com"
-        self.get_data_url = "https://insideairbnb.com/get-the-data/"
         
         # 分类数据类型：data文件夹 vs visualisations文件夹
         self.data_files = [
@@ -26,6 +30,23 @@ class CityDownloader:
         
         self._city_mappings = None
         
+        # 城市名检索索引：小写名称/文件夹名/逗号分段 -> display name
+        self._search_index = {}
+        self._search_entries = []
+        
+        # 复用连接：所有请求都指向同一组主机，keep-alive 省去每个文件的 TLS 握手
+        self.session = requests.Session()
+        self.session.headers.update(SESSION_HEADERS)
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=32,
+            max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+        )
+        self.session.mount('https://', adapter)
+        
+        # 同时下载的文件数（不超过连接池大小）
+        self.max_workers = 8
+        
     def _get_city_mappings(self) -> Dict[str, Dict]:
         """Get city display name to URL path mapping"""
         if self._city_mappings is not None:
@@ -33,25 +54,11 @@ class CityDownloader:
             
         print("Parsing city mappings...")
         try:
-            soup = BeautifulSoup(requests.get(self.get_data_url).content, 'html.parser')
-            mappings = {}
-            
-            for h3 in soup.find_all('h3'):
-                city_display_name = h3.get_text().strip()
-                if any(word in city_display_name.lower() for word in ['get the data', 'archived', 'contact']):
-                    continue
-                
-                url_path = self._find_city_url_path(h3)
-                latest_date = self._find_latest_date(h3)
-                
-                if url_path and latest_date:
-                    mappings[city_display_name] = {
-                        'url_path': url_path,
-                        'latest_date': latest_date,
-                        'city_folder': self._get_city_folder_name(city_display_name)
-                    }
+            # 只保留有下载链接的城市
+            mappings = {name: info for name, info in get_index(self.session).items() if info['url_path']}
             
             self._city_mappings = mappings
+            self._build_search_index(mappings)
             print(f"Found {len(mappings)} city mappings")
             return mappings
             
@@ -59,63 +66,20 @@ class CityDownloader:
             print(f"Failed to get city mappings: {e}")
             return {}
     
-    def _find_city_url_path(self, header):
-        """Find URL path after city header"""
-        current = header
-        
-        for _ in range(15):
-            current = current.next_sibling
-            if not current or current.name == 'h3':
-                break
-            
-            if hasattr(current, 'find_all'):
-                links = current.find_all('a', href=True)
-                for link in links:
-                    href = link['href']
-                    if 'data.insideairbnb.com' in href:
-                        return self._extract_url_path(href)
-        
-        return None
-    
-    def _extract_url_path(self, url: str) -> str:
-        """Extract city path from full URL"""
-        try:
-            parsed = urlparse(url)
-            path_parts = [p for p in parsed.path.split('/') if p]
-            
-            if len(path_parts) >= 5 and path_parts[-2] == 'data':
-                return '/'.join(path_parts[:3])
-            
-            return None
-        except:
-            return None
-    
-    def _find_latest_date(self, header) -> str:
-        """Find latest date"""
-        dates = []
-        current = header
-        
-        for _ in range(10):
-            current = current.next_sibling
-            if not current or current.name == 'h3':
-                break
-                
-            text = current.get_text() if hasattr(current, 'get_text') else str(current)
-            
-            dates.extend(re.findall(r'\d{4}-\d{2}-\d{2}', text))
-            
-            for day, month, year in re.findall(r'(\d{1,2})\s+([A-Za-z]+),?\s+(\d{4})', text):
-                months = {'january':1, 'february':2, 'march':3, 'april':4, 'may':5, 'june':6,
-                         'july':7, 'august':8, 'september':9, 'october':10, 'november':11, 'december':12}
-                if month.lower() in months:
-                    dates.append(f"{year}-{months[month.lower()]:02d}-{int(day):02d}")
+    def _build_search_index(self, mappings: Dict[str, Dict]):
+        """Index lowercased names, folder names and comma parts for city lookup"""
+        index = {}
+        entries = []
         
-        return max(dates) if dates else ""
-    
-    def _get_city_folder_name(self, display_name: str) -> str:
-        """Generate folder name from display name"""
-        city_name = display_name.split(',')[0].strip()
-        return city_name.lower().replace(' ', '_').replace('-', '_')
+        for display_name, info in mappings.items():
+            display_lower = display_name.lower()
+            keys = [display_lower, info['city_folder']] + [part.strip() for part in display_lower.split(',')]
+            for key in keys:
+                index.setdefault(key, display_name)
+            entries.append((display_lower, info['city_folder'], display_name))
+        
+        self._search_index = index
+        self._search_entries = entries
     
     def _find_matching_cities(self, city_names: List[str]) -> Dict[str, Dict]:
         """Find matching cities based on input city names"""
@@ -124,21 +88,21 @@ class CityDownloader:
         
         for input_name in city_names:
             input_lower = input_name.lower()
-            found = False
             
-            for display_name, info in mappings.items():
-                if (input_lower in display_name.lower() or 
-                    input_lower in info['city_folder'] or
-                    any(input_lower in part.lower() for part in display_name.split(','))):
-                    matches[input_name] = {
-                        'display_name': display_name,
-                        **info
-                    }
-                    found = True
-                    break
+            # 先查精确匹配，再按子串模糊匹配
+            display_name = self._search_index.get(input_lower.strip())
+            if display_name is None:
+                display_name = next((name for display_lower, folder, name in self._search_entries
+                                     if input_lower in display_lower or input_lower in folder), None)
             
-            if not found:
+            if display_name is None:
                 print(f"City not found: {input_name}")
+                continue
+            
+            matches[input_name] = {
+                'display_name': display_name,
+                **mappings[display_name]
+            }
         
         return matches
     
@@ -167,29 +131,40 @@ class CityDownloader:
         
         results = {}
         
-        for input_name, city_info in matched_cities.items():
-            print(f"\nDownloading {city_info['display_name']} (path: {downloadpath})...")
+        # 所有城市同时开始，文件下载共用一个线程池，总并发不超过 max_workers
+        # 多个输入匹配到同一城市时只下载一次
+        with ThreadPoolExecutor(max_workers=self.max_workers) as file_executor, \
+             ThreadPoolExecutor(max_workers=len(matched_cities)) as city_executor:
+            futures = {}
+            for input_name, city_info in matched_cities.items():
+                display_name = city_info['display_name']
+                if display_name not in futures:
+                    print(f"\nDownloading {display_name} (path: {downloadpath})...")
+                    futures[display_name] = city_executor.submit(
+                        self._download_single_city, city_info, output_dir, force_download, downloadpath, file_executor
+                    )
             
-            try:
-                downloaded_files = self._download_single_city(city_info, output_dir, force_download, downloadpath)
-                results[input_name] = {
-                    'display_name': city_info['display_name'],
-                    'files': downloaded_files,
-                    'status': 'success'
-                }
-                
-            except Exception as e:
-                print(f"Download failed: {e}")
-                results[input_name] = {
-                    'display_name': city_info['display_name'],
-                    'files': {},
-                    'status': 'failed',
-                    'error': str(e)
-                }
+            for input_name, city_info in matched_cities.items():
+                try:
+                    downloaded_files = futures[city_info['display_name']].result()
+                    results[input_name] = {
+                        'display_name': city_info['display_name'],
+                        'files': downloaded_files,
+                        'status': 'success'
+                    }
+                    
+                except Exception as e:
+                    print(f"Download failed: {e}")
+                    results[input_name] = {
+                        'display_name': city_info['display_name'],
+                        'files': {},
+                        'status': 'failed',
+                        'error': str(e)
+                    }
         
         return results
     
-    def _download_single_city(self, city_info: Dict, output_dir: str, force_download: bool = False, downloadpath: str = "all") -> Dict[str, str]:
+    def _download_single_city(self, city_info: Dict, output_dir: str, force_download: bool = False, downloadpath: str = "all", executor: ThreadPoolExecutor = None) -> Dict[str, str]:
         """Download data for a single city"""
         url_path = city_info['url_path']
         date = city_info['latest_date']
@@ -215,9 +190,21 @@ class CityDownloader:
         
         total_files = len(files_to_download)
         
-        # 下载文件
-        for filename, folder_type in files_to_download:
-            result = self._download_file(url_path, date, filename, city_dir, folder_type, force_download)
+        # 一次扫描目录得到已有文件及大小，代替逐个文件 exists()/stat()
+        with os.scandir(city_dir) as entries:
+            existing = {entry.name: entry.stat().st_size for entry in entries if entry.is_file()}
+        
+        # 并发下载文件：瓶颈在网络等待，线程共享同一个 Session 连接池
+        def download(item):
+            return self._download_file(url_path, date, item[0], city_dir, item[1], force_download, existing)
+        
+        if executor is None:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as own_executor:
+                results = list(own_executor.map(download, files_to_download))
+        else:
+            results = list(executor.map(download, files_to_download))
+        
+        for (filename, _), result in zip(files_to_download, results):
             if result == "success":
                 downloaded_files[filename] = str(city_dir / filename)
                 success_count += 1
@@ -225,30 +212,78 @@ class CityDownloader:
                 downloaded_files[filename] = str(city_dir / filename)
                 skipped_count += 1
         
-        print(f"Downloaded: {success_count}, Skipped: {skipped_count}, Failed: {total_files - success_count - skipped_count}")
+        print(f"{city_info['display_name']} - Downloaded: {success_count}, Skipped: {skipped_count}, Failed: {total_files - success_count - skipped_count}")
         return downloaded_files
     
-    def _download_file(self, url_path: str, date: str, filename: str, city_dir: Path, folder_type: str, force_download: bool = False) -> str:
+    def _download_file(self, url_path: str, date: str, filename: str, city_dir: Path, folder_type: str, force_download: bool = False, existing: Dict[str, int] = None) -> str:
         """Download a single file from either data or visualisations folder"""
         file_path = city_dir / filename
+        meta_path = city_dir / f"{filename}.meta"
+        download_url = f"{self.base_url}/{url_path}/{date}/{folder_type}/{filename}"
         
-        # 检查文件是否已存在
-        if file_path.exists() and not force_download:
+        # existing: 目录中已有文件名 -> 大小，由调用方一次扫描得到
+        if existing is None:
+            existing = {p.name: p.stat().st_size for p in (file_path, meta_path) if p.exists()}
+        
+        local_size = existing.get(filename, 0)
+        meta = self._read_meta(meta_path) if meta_path.name in existing else {}
+        
+        # 上次完整下载时记录的大小与本地一致，无需再请求服务器
+        if local_size and not force_download and meta.get('size') == local_size:
             print(f"  Skipped {filename} (already exists)")
             return "skipped"
         
+        # 数据文件不要求传输压缩，保证 Content-Length 和 Range 都按文件本身的字节计算
+        identity = {'Accept-Encoding': 'identity'}
+        
+        # HEAD 预检：获取远端大小和修改时间（本地没有文件时直接下载，省去一次往返）
+        remote_size, last_modified = 0, None
+        if local_size:
+            try:
+                head = self.session.head(download_url, headers=identity, timeout=10, allow_redirects=True)
+                head.raise_for_status()
+                remote_size = int(head.headers.get('Content-Length', 0))
+                last_modified = head.headers.get('Last-Modified')
+            except Exception:
+                pass
+            
+            if remote_size == local_size and (not force_download or meta.get('last_modified') == last_modified):
+                self._write_meta(meta_path, {'size': local_size, 'last_modified': last_modified})
+                print(f"  Skipped {filename} (already exists)")
+                return "skipped"
+            if not force_download and not remote_size:
+                print(f"  Skipped {filename} (already exists)")
+                return "skipped"
+        
+        # 本地是不完整的文件时断点续传，否则从头下载
+        start = local_size if not force_download and 0 < local_size < remote_size else 0
+        
         try:
-            download_url = f"{self.base_url}/{url_path}/{date}/{folder_type}/{filename}"
+            headers = {**identity, 'Range': f"bytes={start}-"} if start else identity
             
-            print(f"  Downloading {filename} from {folder_type}/...")
+            if start:
+                print(f"  Resuming {filename} from {folder_type}/ at {start} bytes...")
+            else:
+                print(f"  Downloading {filename} from {folder_type}/...")
             
-            response = requests.get(download_url, stream=True, timeout=30)
+            response = self.session.get(download_url, headers=headers, stream=True, timeout=30)
             response.raise_for_status()
             
-            with open(file_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
+            # 服务器忽略了 Range 时返回完整内容
+            if start and response.status_code != 206:
+                start = 0
+            
+            # 直接从底层流按 1MB 块复制，减少 Python 层循环和 write 调用
+            # .gz 文件原样写盘，避免被 urllib3 解压成未压缩内容
+            response.raw.decode_content = not filename.endswith('.gz')
+            meta_path.unlink(missing_ok=True)
+            with open(file_path, 'ab' if start else 'wb') as f:
+                shutil.copyfileobj(response.raw, f, length=1024 * 1024)
+            
+            self._write_meta(meta_path, {
+                'size': file_path.stat().st_size,
+                'last_modified': response.headers.get('Last-Modified', last_modified)
+            })
             
             print(f"  Success: {filename}")
             return "success"
@@ -256,6 +291,17 @@ class CityDownloader:
         except Exception as e:
             print(f"  Failed {filename}: {e}")
             return "failed"
+    
+    def _read_meta(self, meta_path: Path) -> Dict:
+        """Read the size/Last-Modified sidecar of a downloaded file"""
+        try:
+            return json.loads(meta_path.read_text())
+        except (OSError, ValueError):
+            return {}
+    
+    def _write_meta(self, meta_path: Path, meta: Dict):
+        """Write the size/Last-Modified sidecar of a downloaded file"""
+        meta_path.write_text(json.dumps(meta))
 
 # Create global instance
 _downloader = CityDownloader()
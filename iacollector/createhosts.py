@@ -1,7 +1,8 @@
-import pandas as pd
-import psycopg2
+from psycopg2 import sql
 from sqlalchemy import create_engine, text
-from pathlib import Path
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from ._sql import execute_sql
 
 class CreateHosts:
     def __init__(self, db_host="localhost", db_user="postgres", db_password="", db_port=5432):
@@ -12,8 +13,8 @@ class CreateHosts:
             'port': db_port
         }
         
-        # Host相关字段
-        self.host_columns = [
+        # Host相关字段（tuple 保持字段顺序）
+        self.host_columns = (
             'host_id', 'host_url', 'host_name', 'host_since', 'host_location', 
             'host_about', 'host_response_time', 'host_response_rate', 
             'host_acceptance_rate', 'host_is_superhost', 'host_thumbnail_url', 
@@ -23,94 +24,79 @@ class CreateHosts:
             'calculated_host_listings_count_entire_homes', 
             'calculated_host_listings_count_private_rooms',
             'calculated_host_listings_count_shared_rooms'
-        ]
-    
-    def get_all_listings_tables(self, engine):
-        """获取所有城市的listings表"""
-        with engine.connect() as conn:
-            result = conn.execute(text("""
-                SELECT schemaname, tablename 
-                FROM pg_tables 
-                WHERE schemaname != 'information_schema' 
-                AND schemaname != 'pg_catalog'
-                AND tablename LIKE 'listings_%'
-                ORDER BY schemaname, tablename
-            """))
-            return result.fetchall()
+        )
+        
+        # 并发处理的表数（不超过连接池大小）
+        self.max_workers = 8
     
-    def table_exists(self, engine, schema_name, table_name):
-        """Check if table exists"""
-        with engine.connect() as conn:
-            result = conn.execute(text(f"""
-                SELECT 1 FROM information_schema.tables 
-                WHERE table_schema = '{schema_name}' 
-                AND table_name = '{table_name}'
-            """))
-            return result.fetchone() is not None
+    def get_all_tables(self, conn):
+        """一次查询所有用户表，返回 {(schema, table)}"""
+        result = conn.execute(text("""
+            SELECT schemaname, tablename 
+            FROM pg_tables 
+            WHERE schemaname != 'information_schema' 
+            AND schemaname != 'pg_catalog'
+        """))
+        return {(schema_name, table_name) for schema_name, table_name in result}
     
-    def extract_hosts_from_listings(self, engine, schema_name, listings_table):
-        """从listings表提取hosts数据"""
-        
-        # 构建查询，只选择存在的host字段
-        available_columns = []
-        with engine.connect() as conn:
-            result = conn.execute(text(f"""
-                SELECT column_name 
-                FROM information_schema.columns 
-                WHERE table_schema = '{schema_name}' 
-                AND table_name = '{listings_table}'
-            """))
-            existing_cols = [row[0] for row in result.fetchall()]
-        
-        # 找出实际存在的host字段
-        for col in self.host_columns:
-            if col in existing_cols:
-                available_columns.append(col)
+    def get_listings_columns(self, conn):
+        """一次查询所有listings表的字段，返回 {(schema, table): {columns}}"""
+        result = conn.execute(text("""
+            SELECT table_schema, table_name, column_name 
+            FROM information_schema.columns 
+            WHERE table_name LIKE :pattern
+        """), {'pattern': 'listings\\_%'})
         
-        if not available_columns:
-            print(f"    No host columns found in {schema_name}.{listings_table}")
-            return None
+        columns = defaultdict(set)
+        for schema_name, table_name, column_name in result:
+            columns[(schema_name, table_name)].add(column_name)
+        return columns
+    
+    def get_host_columns(self, existing_cols):
+        """找出listings表中实际存在的host字段"""
+        # 按 host_columns 的顺序遍历，用集合做 O(1) 成员判断
+        existing_set = existing_cols if isinstance(existing_cols, (set, frozenset)) else set(existing_cols)
+        return [col for col in self.host_columns if col in existing_set]
+    
+    def create_hosts_table(self, conn, schema_name, listings_table, hosts_table, host_columns):
+        """在数据库内从listings表创建hosts表并设置主键，返回host数量"""
+        hosts_ref = sql.Identifier(schema_name, hosts_table)
         
-        # 构建SQL查询
-        columns_str = ', '.join(available_columns)
-        sql = f"""
-            SELECT DISTINCT {columns_str}
-            FROM {schema_name}.{listings_table}
+        # CREATE TABLE AS 直接在 PostgreSQL 内完成提取和去重（以host_id为基准），数据不经过 Python
+        host_count = execute_sql(conn, sql.SQL("""
+            CREATE TABLE {} AS
+            SELECT DISTINCT ON (host_id) {}
+            FROM {}
             WHERE host_id IS NOT NULL
-        """
+        """).format(
+            hosts_ref,
+            sql.SQL(', ').join(map(sql.Identifier, host_columns)),
+            sql.Identifier(schema_name, listings_table)
+        ))
+        if not host_count:
+            return 0
         
-        # 执行查询
-        df = pd.read_sql(sql, engine)
+        # 添加主键约束：DISTINCT ON (host_id) 和 host_id IS NOT NULL 已保证主键唯一且非空，
+        # 与建表在同一事务内完成；对已写入的数据一次排序建索引，比先建主键再逐行插入更快
+        execute_sql(conn, sql.SQL("ALTER TABLE {} ADD CONSTRAINT {} PRIMARY KEY (host_id)").format(
+            hosts_ref, sql.Identifier(hosts_table + '_pk')
+        ))
         
-        # 去重（以host_id为基准）
-        if 'host_id' in df.columns:
-            df = df.drop_duplicates(subset=['host_id'])
-        
-        return df
-    
-    def create_hosts_table(self, engine, schema_name, hosts_table, df):
-        """创建hosts表并设置主键"""
-        # 创建表
-        df.to_sql(hosts_table, engine, schema=schema_name, if_exists='replace', index=False)
-        
-        # 添加主键约束
-        if 'host_id' in df.columns:
-            try:
-                with engine.connect() as conn:
-                    conn.execute(text(f"""
-                        ALTER TABLE {schema_name}.{hosts_table} 
-                        ADD CONSTRAINT {hosts_table}_pk PRIMARY KEY (host_id)
-                    """))
-                    conn.commit()
-            except Exception as e:
-                print(f"    Warning: Could not add primary key: {e}")
+        return host_count
     
     def process_all_cities(self):
         """处理所有城市的listings表"""
-        engine = create_engine(f"postgresql://{self.db_config['user']}:{self.db_config['password']}@{self.db_config['host']}:{self.db_config['port']}/ia_detail")
+        engine = create_engine(
+            f"postgresql+psycopg2://{self.db_config['user']}:{self.db_config['password']}@{self.db_config['host']}:{self.db_config['port']}/ia_detail",
+            pool_size=16, max_overflow=8, pool_pre_ping=True
+        )
+        
+        # 获取所有表和listings表的字段（各一次查询）
+        with engine.connect() as conn:
+            existing_tables = self.get_all_tables(conn)
+            columns = self.get_listings_columns(conn)
         
-        # 获取所有listings表
-        tables = self.get_all_listings_tables(engine)
+        tables = sorted(t for t in existing_tables if t[1].startswith('listings_'))
         
         if not tables:
             print("No listings tables found in ia_detail database")
@@ -118,33 +104,47 @@ class CreateHosts:
         
         print(f"Found {len(tables)} listings tables")
         
-        for schema_name, listings_table in tables:
-            # 提取日期（假设表名格式为 listings_YYYY_MM_DD）
-            date_part = listings_table.replace('listings_', '')
-            hosts_table = f"hosts_{date_part}"
-            
-            # 检查hosts表是否已存在
-            if self.table_exists(engine, schema_name, hosts_table):
-                print(f"Skipping {schema_name}.{hosts_table} (already exists)")
-                continue
-            
-            print(f"Processing {schema_name}.{listings_table} -> {hosts_table}")
-            
-            try:
-                # 提取hosts数据
-                hosts_df = self.extract_hosts_from_listings(engine, schema_name, listings_table)
+        # 各表互不依赖，耗时主要在等待数据库，用线程并发处理（每个线程从连接池取自己的连接）
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            list(executor.map(lambda table: self._process_one(engine, existing_tables, columns, table), tables))
+    
+    def _process_one(self, engine, existing_tables, columns, table):
+        """Create the hosts table for one listings table"""
+        schema_name, listings_table = table
+        
+        # 提取日期（假设表名格式为 listings_YYYY_MM_DD）
+        date_part = listings_table.replace('listings_', '')
+        hosts_table = f"hosts_{date_part}"
+        
+        # 检查hosts表是否已存在
+        if (schema_name, hosts_table) in existing_tables:
+            print(f"Skipping {schema_name}.{hosts_table} (already exists)")
+            return
+        
+        try:
+            # 提取、建表在同一个连接和事务中完成
+            with engine.begin() as conn:
+                print(f"Processing {schema_name}.{listings_table} -> {hosts_table}")
                 
-                if hosts_df is None or hosts_df.empty:
-                    print(f"    No host data found")
-                    continue
+                # 找出可用的host字段
+                host_columns = self.get_host_columns(columns[(schema_name, listings_table)])
                 
-                # 创建hosts表
-                self.create_hosts_table(engine, schema_name, hosts_table, hosts_df)
+                if 'host_id' not in host_columns:
+                    print(f"    No host columns found in {schema_name}.{listings_table}")
+                    return
                 
-                print(f"    Created {schema_name}.{hosts_table} with {len(hosts_df)} hosts")
+                # 创建hosts表
+                host_count = self.create_hosts_table(conn, schema_name, listings_table, hosts_table, host_columns)
                 
-            except Exception as e:
-                print(f"    Error processing {schema_name}.{listings_table}: {e}")
+                if not host_count:
+                    execute_sql(conn, sql.SQL("DROP TABLE {}").format(sql.Identifier(schema_name, hosts_table)))
+                    print(f"    No host data found")
+                    return
+            
+            print(f"    Created {schema_name}.{hosts_table} with {host_count} hosts")
+            
+        except Exception as e:
+            print(f"    Error processing {schema_name}.{listings_table}: {e}")
 
 # Create global instance
 _createhosts = CreateHosts()
@@ -1,12 +1,61 @@
 import os
-import gzip
+import io
+import multiprocessing
 import pandas as pd
 import psycopg2
+from psycopg2 import sql
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from sqlalchemy import create_engine, text
-import re
+from ._sql import execute_sql
+
+def copy_dataframe(conn, schema_name, table_name, df):
+    """Load a DataFrame into an existing table with COPY FROM STDIN"""
+    # 空值写成空字段，COPY 的 CSV 格式按 NULL 读入；
+    # 行尾用 \r\n，csv 写入器才会给含单独 \r 的文本加引号，否则 COPY 报 "unquoted newline"
+    buf = io.StringIO()
+    df.to_csv(buf, header=False, index=False, lineterminator='\r\n')
+    buf.seek(0)
+    
+    query = sql.SQL("COPY {} ({}) FROM STDIN WITH CSV").format(
+        sql.Identifier(schema_name, table_name),
+        sql.SQL(', ').join(map(sql.Identifier, df.columns))
+    )
+    
+    # conn 是 SQLAlchemy 连接，通过底层 psycopg2 连接执行 COPY（与建表同一事务）
+    with conn.connection.cursor() as cur:
+        cur.copy_expert(query, buf)
 
 class ToSQL:
+    # clean_price_field 要删除的字符
+    _PRICE_TRANSLATE = str.maketrans('', '', '$,€£¥₹')
+    
+    # listings 中数值列的类型，read_csv 直接按此解析，不再逐列推断；文件中没有的列会被忽略
+    LISTINGS_DTYPES = {
+        'id': 'Int64', 'scrape_id': 'Int64', 'host_id': 'Int64',
+        'latitude': 'float64', 'longitude': 'float64',
+        'accommodates': 'Int16', 'bathrooms': 'float64', 'bedrooms': 'Int16', 'beds': 'Int16',
+        'minimum_nights': 'Int32', 'maximum_nights': 'Int32',
+        'minimum_minimum_nights': 'Int32', 'maximum_minimum_nights': 'Int32',
+        'minimum_maximum_nights': 'Int32', 'maximum_maximum_nights': 'Int32',
+        'minimum_nights_avg_ntm': 'float64', 'maximum_nights_avg_ntm': 'float64',
+        'availability_30': 'Int16', 'availability_60': 'Int16',
+        'availability_90': 'Int16', 'availability_365': 'Int16',
+        'number_of_reviews': 'Int32', 'number_of_reviews_ltm': 'Int32',
+        'number_of_reviews_l30d': 'Int32', 'number_of_reviews_ly': 'Int32',
+        'host_listings_count': 'Int32', 'host_total_listings_count': 'Int32',
+        'calculated_host_listings_count': 'Int32',
+        'calculated_host_listings_count_entire_homes': 'Int32',
+        'calculated_host_listings_count_private_rooms': 'Int32',
+        'calculated_host_listings_count_shared_rooms': 'Int32',
+        'estimated_occupancy_l365d': 'Int32', 'estimated_revenue_l365d': 'float64',
+        'review_scores_rating': 'float64', 'review_scores_accuracy': 'float64',
+        'review_scores_cleanliness': 'float64', 'review_scores_checkin': 'float64',
+        'review_scores_communication': 'float64', 'review_scores_location': 'float64',
+        'review_scores_value': 'float64', 'reviews_per_month': 'float64'
+    }
+    
     def __init__(self, db_host="localhost", db_user="postgres", db_password="", db_port=5432):
         self.db_config = {
             'host': db_host,
@@ -33,92 +82,129 @@ class ToSQL:
             'reviews_per_month'
         ]
         
-    def create_database_if_not_exists(self, db_name):
-        """Create database if it doesn't exist"""
+        # listings 中取值很少的文本列和 t/f 标志列
+        self.category_fields = ['room_type', 'property_type', 'host_response_time',
+                                'host_neighbourhood', 'neighbourhood_cleansed']
+        self.flag_fields = ['host_is_superhost', 'instant_bookable']
+        
+        # read_csv 每块的行数
+        self.chunksize = 200_000
+        # 并行加载的最大进程数（不超过 CPU 核数）；None 表示只在 fork 启动方式下用默认的 8 个进程
+        self.max_workers = None
+        # 加载事务里建主键索引的排序内存（每个并行进程各自占用）
+        self.maintenance_work_mem = '256MB'
+        
+        # 按数据库名缓存的 engine
+        self._engines = {}
+        # run() 期间共用的管理连接（连 postgres 库，用于建数据库）
+        self._admin_conn = None
+        
+    def _engine_for(self, db_name):
+        """Get the pooled engine for db_name, creating it on first use"""
+        # 每个数据库只建一个 engine，建 schema、查表、加载都复用池里已连好的连接
+        if db_name not in self._engines:
+            self._engines[db_name] = create_engine(
+                f"postgresql+psycopg2://{self.db_config['user']}:{self.db_config['password']}@{self.db_config['host']}:{self.db_config['port']}/{db_name}",
+                pool_size=8,
+                max_overflow=16,
+                pool_pre_ping=True,
+                # 没走 COPY 的批量 INSERT 也会用 execute_values / execute_batch 合并成多行语句
+                executemany_mode='values_plus_batch',
+                insertmanyvalues_page_size=10000,
+                executemany_batch_page_size=500
+            )
+        return self._engines[db_name]
+    
+    def _connect_admin(self):
+        """Open an autocommit connection to the postgres maintenance database"""
         conn = psycopg2.connect(**self.db_config, database='postgres')
         conn.autocommit = True
-        cur = conn.cursor()
+        return conn
+    
+    def create_database_if_not_exists(self, db_name):
+        """Create database if it doesn't exist"""
+        # run() 期间复用同一个管理连接，单独调用时才临时连接
+        conn = self._admin_conn or self._connect_admin()
         
-        cur.execute(f"SELECT 1 FROM pg_database WHERE datname = '{db_name}'")
-        if not cur.fetchone():
-            cur.execute(f"CREATE DATABASE {db_name}")
-            print(f"Created database: {db_name}")
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1 FROM pg_database WHERE datname = %s", (db_name,))
+                if not cur.fetchone():
+                    cur.execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(db_name)))
+                    print(f"Created database: {db_name}")
+        finally:
+            if conn is not self._admin_conn:
+                conn.close()
+    
+    def create_schemas_if_not_exist(self, engine, schema_names):
+        """Create all missing schemas in one transaction"""
+        if not schema_names:
+            return
         
-        cur.close()
-        conn.close()
+        # 所有城市的 CREATE SCHEMA 合并成一条语句，一次往返
+        with engine.begin() as conn:
+            execute_sql(conn, sql.SQL('; ').join(
+                sql.SQL("CREATE SCHEMA IF NOT EXISTS {}").format(sql.Identifier(schema_name)) for schema_name in schema_names
+            ))
     
-    def create_schema_if_not_exists(self, engine, schema_name):
-        """Create schema if it doesn't exist"""
+    def existing_tables(self, engine, schema_names):
+        """Get {(schema, table): estimated rows} for all tables in the given schemas"""
+        # 一次查询系统目录拿到所有已存在的表和估算行数，代替每个文件一次 table_exists 查询
         with engine.connect() as conn:
-            conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {schema_name}"))
-            conn.commit()
+            result = conn.execute(text("""
+                SELECT n.nspname, c.relname, c.reltuples FROM pg_class c 
+                JOIN pg_namespace n ON n.oid = c.relnamespace 
+                WHERE n.nspname = ANY(:schemas) AND c.relkind IN ('r', 'p')
+            """), {'schemas': list(schema_names)})
+            return {(schema, table): reltuples for schema, table, reltuples in result}
     
-    def table_exists(self, engine, schema_name, table_name):
-        """Check if table exists"""
-        with engine.connect() as conn:
-            result = conn.execute(text(f"""
-                SELECT 1 FROM information_schema.tables 
-                WHERE table_schema = '{schema_name}' 
-                AND table_name = '{table_name}'
-            """))
-            return result.fetchone() is not None
+    def _skip_message(self, existing, schema_name, table_name):
+        """Describe an already loaded table"""
+        # reltuples 为 -1 表示表还没有被 ANALYZE 过，没有行数估算
+        reltuples = existing[(schema_name, table_name)]
+        if reltuples >= 0:
+            return f"Skipping {schema_name}.{table_name} (already exists, ~{int(reltuples)} rows)"
+        return f"Skipping {schema_name}.{table_name} (already exists)"
+    
+    def list_date_folders(self, data_dir):
+        """List every <city>/<date> folder under data_dir"""
+        # 一次 glob 得到所有城市/日期目录，detail 和 simple 两步共用
+        return sorted(path for path in Path(data_dir).glob('*/*/') if path.is_dir())
     
     def clean_price_field(self, price_series):
         """Clean price field: remove currency symbols and convert to float"""
-        def clean_price(price):
-            if pd.isna(price):
-                return None
-            
-            # Convert to string if not already
-            price_str = str(price)
-            
-            # Remove currency symbols and common formatting
-            price_clean = re.sub(r'[\$,€£¥₹]', '', price_str)
-            price_clean = price_clean.strip()
-            
-            try:
-                return float(price_clean)
-            except (ValueError, TypeError):
-                return None
-        
-        return price_series.apply(clean_price)
+        # 整列字符串操作，用转换表删除货币符号和千分位逗号，不经过正则；无法解析的值变为 NaN
+        price_clean = price_series.astype('string').str.translate(self._PRICE_TRANSLATE).str.strip()
+        return pd.to_numeric(price_clean, errors='coerce').astype('float64')
     
     def clean_date_field(self, date_series):
         """Clean date field: convert to YYYY-MM-DD format"""
-        def clean_date(date_val):
-            if pd.isna(date_val):
-                return None
-            
-            try:
-                # Use pandas to_datetime which handles many formats
-                parsed_date = pd.to_datetime(date_val, errors='coerce')
-                if pd.isna(parsed_date):
-                    return None
-                return parsed_date.strftime('%Y-%m-%d')
-            except:
-                return None
-        
-        return date_series.apply(clean_date)
+        # 整列解析和格式化；无法解析的值变为 None
+        parsed_dates = pd.to_datetime(date_series, errors='coerce')
+        return parsed_dates.dt.strftime('%Y-%m-%d').where(parsed_dates.notna(), None)
     
-    def filter_selected_columns(self, df, selected_columns):
+    def filter_selected_columns(self, df, selected_columns, verbose=True):
         """Filter dataframe to only include selected columns that exist"""
-        available_columns = [col for col in selected_columns if col in df.columns]
-        missing_columns = [col for col in selected_columns if col not in df.columns]
+        # 一次求交集（保持 selected_columns 的顺序），缺失列数直接相减得到
+        available_columns = pd.Index(selected_columns).intersection(df.columns, sort=False)
+        missing_count = len(selected_columns) - len(available_columns)
         
-        if missing_columns:
-            print(f"    Note: {len(missing_columns)} columns not found in data")
+        if verbose and missing_count:
+            print(f"    Note: {missing_count} columns not found in data")
         
-        return df[available_columns].copy()
+        return df.loc[:, available_columns]
     
-    def process_listings_detail_dataframe(self, df, use_selected_detail=False):
+    def process_listings_detail_dataframe(self, df, use_selected_detail=False, verbose=True):
         """Process listings detail dataframe with field transformations"""
         
         # 1. 如果启用精选字段，先筛选列
         if use_selected_detail:
-            df_processed = self.filter_selected_columns(df, self.selected_detail_columns)
-            print(f"    Selected {len(df_processed.columns)} out of {len(df.columns)} columns")
+            df_processed = self.filter_selected_columns(df, self.selected_detail_columns, verbose)
+            if verbose:
+                print(f"    Selected {len(df_processed.columns)} out of {len(self.selected_detail_columns)} columns")
         else:
-            df_processed = df.copy()
+            # 调用方读完即丢弃原 df，直接在上面修改，不再整表复制
+            df_processed = df
         
         # 2. Rename columns
         column_renames = {
@@ -127,12 +213,11 @@ class ToSQL:
             'description': 'listing_description'
         }
         
-        for old_col, new_col in column_renames.items():
-            if old_col in df_processed.columns:
-                df_processed = df_processed.rename(columns={old_col: new_col})
+        # 一次改名，不存在的列 pandas 会自动忽略
+        df_processed.rename(columns=column_renames, inplace=True)
         
-        # 3. Clean price field
-        if 'price' in df_processed.columns:
+        # 3. Clean price field（已按数值读入时跳过）
+        if 'price' in df_processed.columns and not pd.api.types.is_numeric_dtype(df_processed['price']):
             df_processed['price'] = self.clean_price_field(df_processed['price'])
         
         # 4. Clean date fields
@@ -143,11 +228,20 @@ class ToSQL:
             if date_field in df_processed.columns:
                 df_processed[date_field] = self.clean_date_field(df_processed[date_field])
         
+        # 5. 低基数文本列转为 category，t/f 标志列转为布尔，减少内存和写 COPY 数据的开销
+        for category_field in self.category_fields:
+            if category_field in df_processed.columns:
+                df_processed[category_field] = df_processed[category_field].astype('category')
+        
+        for flag_field in self.flag_fields:
+            if flag_field in df_processed.columns:
+                df_processed[flag_field] = df_processed[flag_field].map({'t': True, 'f': False}).astype('boolean')
+        
         return df_processed
     
     def process_listings_simple_dataframe(self, df):
         """Process listings simple dataframe with field transformations"""
-        df_processed = df.copy()
+        df_processed = df
         
         # Rename columns for simple listings
         column_renames = {
@@ -155,171 +249,254 @@ class ToSQL:
             'name': 'listing_name'
         }
         
-        for old_col, new_col in column_renames.items():
-            if old_col in df_processed.columns:
-                df_processed = df_processed.rename(columns={old_col: new_col})
+        # 一次改名，不存在的列 pandas 会自动忽略
+        df_processed.rename(columns=column_renames, inplace=True)
         
         return df_processed
     
-    def create_table_with_primary_key(self, engine, schema_name, table_name, df, pk_column):
-        """Create table with primary key constraint"""
-        # First create the table normally
-        df.to_sql(table_name, engine, schema=schema_name, if_exists='fail', index=False)
-        
-        # Then add primary key constraint
+    def create_table(self, conn, schema_name, table_name, df):
+        """Create an empty table with columns typed from the dataframe"""
+        # 由 dtype 直接生成 CREATE TABLE，之后只做 COPY，不再经过 to_sql 的表反射和 INSERT 路径
+        conn.exec_driver_sql(pd.io.sql.get_schema(df, table_name, con=conn, schema=schema_name))
+    
+    def add_primary_key(self, conn, schema_name, table_name, pk_column):
+        """Add primary key constraint to a loaded table"""
+        # 标识符都加引号转义（城市名来自目录名）；用 SAVEPOINT 包住，加主键失败（如重复 id）时只给出警告，已加载的数据保留
         try:
-            with engine.connect() as conn:
-                conn.execute(text(f"""
-                    ALTER TABLE {schema_name}.{table_name} 
-                    ADD CONSTRAINT {table_name}_pk PRIMARY KEY ({pk_column})
-                """))
-                conn.commit()
+            with conn.begin_nested():
+                execute_sql(conn, sql.SQL("ALTER TABLE {} ADD CONSTRAINT {} PRIMARY KEY ({})").format(
+                    sql.Identifier(schema_name, table_name),
+                    sql.Identifier(table_name + '_pk'),
+                    sql.Identifier(pk_column)
+                ))
         except Exception as e:
             print(f"    Warning: Could not add primary key constraint: {e}")
     
-    def decompress_gz_files(self, data_dir="airbnb_data"):
-        """Decompress all .gz files with _detail suffix"""
-        data_path = Path(data_dir)
+    def _conform_chunk(self, chunk, dtypes):
+        """Cast a chunk back to the column types the table was created with"""
+        for col, dtype in dtypes.items():
+            # 后面的块里出现空值时整数列会被读成 float，转回可空整数才能写入 BIGINT 列
+            if col in chunk.columns and dtype.kind in 'iu' and chunk[col].dtype.kind == 'f':
+                chunk[col] = chunk[col].astype('Int64')
+        return chunk
+    
+    def load_csv_to_table(self, engine, csv_file, schema_name, table_name, transform=None, pk_column=None, **read_kwargs):
+        """Stream a CSV into a new table chunk by chunk"""
+        # 分块读取并逐块 COPY，内存占用不随文件大小增长；整个加载在一个事务里，失败不会留下半张表
+        reader = pd.read_csv(csv_file, chunksize=self.chunksize, **read_kwargs)
+        dtypes = None
         
-        for city_folder in data_path.iterdir():
-            if not city_folder.is_dir():
-                continue
+        with engine.begin() as conn:
+            # 只对本事务生效：提交时不等 WAL 刷盘，建主键索引时可用更多内存排序
+            conn.execute(
+                text("SELECT set_config('synchronous_commit', 'off', true), set_config('maintenance_work_mem', :mem, true)"),
+                {'mem': self.maintenance_work_mem}
+            )
+            
+            for chunk in reader:
+                if transform is not None:
+                    # first_chunk 让转换函数只在第一块输出列筛选等提示，而不是每块重复一次
+                    chunk = transform(chunk, first_chunk=dtypes is None)
                 
-            for date_folder in city_folder.iterdir():
-                if not date_folder.is_dir():
-                    continue
-                    
-                for gz_file in date_folder.glob("*.gz"):
-                    # 修复：正确处理文件名
-                    base_name = gz_file.name.replace('.csv.gz', '').replace('.gz', '')
-                    csv_file = date_folder / f"{base_name}_detail.csv"
+                if dtypes is None:
+                    # 第一块决定表结构；首块中全为空、被推断成 float 的列建成 TEXT，后面的块写入任何值都不会类型冲突
+                    for col in chunk.columns[chunk.isna().all()]:
+                        if chunk[col].dtype == 'float64':
+                            chunk[col] = chunk[col].astype(object)
+                    self.create_table(conn, schema_name, table_name, chunk)
+                    dtypes = chunk.dtypes
+                else:
+                    chunk = self._conform_chunk(chunk, dtypes)
+                
+                copy_dataframe(conn, schema_name, table_name, chunk)
+            
+            # 主键在最后一块之后再加，一次排序建好索引，而不是边加载边维护
+            if pk_column and dtypes is not None:
+                self.add_primary_key(conn, schema_name, table_name, pk_column)
+    
+    def ingest_file(self, engine, csv_file, schema_name, table_name, data_type, detail=True, use_selected_detail=False):
+        """Load one CSV file into schema_name.table_name"""
+        print(f"Loading {schema_name}.{table_name}")
+        
+        try:
+            # 特殊处理 listings 表
+            if data_type == 'listings':
+                if detail:
+                    # 精选字段时只解析需要的列，跳过 description/amenities 等宽文本列
+                    usecols = None
+                    if use_selected_detail:
+                        selected_columns = set(self.selected_detail_columns)
+                        usecols = lambda col: col in selected_columns
                     
-                    if not csv_file.exists():
-                        print(f"Decompressing {gz_file} -> {csv_file.name}")
-                        with gzip.open(gz_file, 'rb') as f_in:
-                            with open(csv_file, 'wb') as f_out:
-                                f_out.write(f_in.read())
+                    self.load_csv_to_table(
+                        engine, csv_file, schema_name, table_name,
+                        transform=lambda df, first_chunk: self.process_listings_detail_dataframe(df, use_selected_detail, verbose=first_chunk),
+                        pk_column='listing_id', compression='infer', usecols=usecols, dtype=self.LISTINGS_DTYPES
+                    )
+                else:
+                    self.load_csv_to_table(
+                        engine, csv_file, schema_name, table_name,
+                        transform=lambda df, first_chunk: self.process_listings_simple_dataframe(df), pk_column='listing_id', dtype=self.LISTINGS_DTYPES
+                    )
+            else:
+                # 其他表正常处理
+                self.load_csv_to_table(engine, csv_file, schema_name, table_name, compression='infer')
+                
+        except Exception as e:
+            print(f"Error loading {csv_file}: {e}")
     
-    def process_detail_data(self, data_dir="airbnb_data", include_calendar=False, use_selected_detail=False):
+    def run_jobs(self, jobs):
+        """Load the collected files in parallel worker processes when possible"""
+        if not jobs:
+            return
+        
+        # 大文件先提交，避免最后只剩一个进程在加载最大的 calendar/reviews
+        jobs = sorted(jobs, key=lambda job: job[1].stat().st_size, reverse=True)
+        
+        # spawn / forkserver（macOS、Windows 默认）会在子进程里重新导入调用脚本，
+        # 所以只有 fork 或调用方明确传入 max_workers 时才启动进程池，其余情况在当前进程逐个加载
+        max_workers = self.max_workers
+        if max_workers is None:
+            max_workers = 8 if multiprocessing.get_start_method() == 'fork' else 1
+        max_workers = min(os.cpu_count() or 1, max_workers, len(jobs))
+        if max_workers <= 1:
+            self.run_jobs_serially(jobs)
+            return
+        
+        # 每个 (城市, 日期, 文件) 互不依赖；每个进程自建 engine 和连接，各自 COPY
+        futures = {}
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(self.db_config,)) as executor:
+                futures = {executor.submit(_ingest_one, job): job for job in jobs}
+                for future in as_completed(futures):
+                    future.result()
+        except BrokenProcessPool as e:
+            # 工作进程异常退出时，没有成功完成的文件改在当前进程里逐个加载（加载是事务性的，中断的表不会留下）；
+            # 按 future 自身状态判断，已成功但还没被 as_completed 取到的不会重复加载
+            remaining = [job for future, job in futures.items()
+                         if not (future.done() and not future.cancelled() and future.exception() is None)]
+            if not futures:
+                remaining = jobs
+            print(f"Worker processes failed ({e}), loading the remaining {len(remaining)} files in this process")
+            self.run_jobs_serially(remaining)
+    
+    def run_jobs_serially(self, jobs):
+        """Load the collected files one by one in this process"""
+        for db_name, *args in jobs:
+            self.ingest_file(self._engine_for(db_name), *args)
+    
+    def process_detail_data(self, data_dir="airbnb_data", include_calendar=False, use_selected_detail=False, date_folders=None):
         """Process all detail files to ia_detail database"""
         self.create_database_if_not_exists('ia_detail')
-        engine = create_engine(f"postgresql://{self.db_config['user']}:{self.db_config['password']}@{self.db_config['host']}:{self.db_config['port']}/ia_detail")
+        engine = self._engine_for('ia_detail')
         
-        data_path = Path(data_dir)
+        if date_folders is None:
+            date_folders = self.list_date_folders(data_dir)
         
-        for city_folder in data_path.iterdir():
-            if not city_folder.is_dir():
-                continue
-                
-            city_name = city_folder.name
-            self.create_schema_if_not_exists(engine, city_name)
+        # 先串行建 schema、跳过已有的表，再把要加载的文件交给进程池
+        city_names = sorted({date_folder.parent.name for date_folder in date_folders})
+        self.create_schemas_if_not_exist(engine, city_names)
+        existing = self.existing_tables(engine, city_names)
+        
+        jobs = []
+        for date_folder in date_folders:
+            city_name = date_folder.parent.name
+            date_str = date_folder.name.replace('-', '_')
             
-            for date_folder in city_folder.iterdir():
-                if not date_folder.is_dir():
+            # 直接读取 .csv.gz 压缩文件，pandas 按后缀自动解压，不再落地解压后的 csv
+            for csv_file in date_folder.glob("*.csv.gz"):
+                # 从文件名提取数据类型 (例如: listings.csv.gz -> listings)
+                data_type = csv_file.name[:-len('.csv.gz')]
+                
+                # 根据参数决定是否跳过 calendar
+                if data_type == 'calendar' and not include_calendar:
+                    print(f"Skipping {csv_file.name} (calendar disabled)")
                     continue
-                    
-                date_str = date_folder.name.replace('-', '_')
                 
-                # 只处理 _detail.csv 文件
-                for csv_file in date_folder.glob("*_detail.csv"):
-                    # 从文件名提取数据类型 (例如: listings_detail.csv -> listings)
-                    data_type = csv_file.stem.replace('_detail', '')
-                    
-                    # 根据参数决定是否跳过 calendar
-                    if data_type == 'calendar' and not include_calendar:
-                        print(f"Skipping {csv_file.name} (calendar disabled)")
-                        continue
-                    
-                    table_name = f"{data_type}_{date_str}"
-                    
-                    # 检查表是否已存在
-                    if self.table_exists(engine, city_name, table_name):
-                        print(f"Skipping {city_name}.{table_name} (already exists)")
-                        continue
-                    
-                    print(f"Loading {city_name}.{table_name}")
-                    
-                    try:
-                        df = pd.read_csv(csv_file, low_memory=False)
-                        
-                        # 特殊处理 listings 表
-                        if data_type == 'listings':
-                            df = self.process_listings_detail_dataframe(df, use_selected_detail)
-                            self.create_table_with_primary_key(engine, city_name, table_name, df, 'listing_id')
-                        else:
-                            # 其他表正常处理
-                            df.to_sql(table_name, engine, schema=city_name, if_exists='fail', index=False)
-                            
-                    except Exception as e:
-                        print(f"Error loading {csv_file}: {e}")
+                table_name = f"{data_type}_{date_str}"
+                
+                # 检查表是否已存在
+                if (city_name, table_name) in existing:
+                    print(self._skip_message(existing, city_name, table_name))
+                    continue
+                
+                jobs.append(('ia_detail', csv_file, city_name, table_name, data_type, True, use_selected_detail))
+        
+        self.run_jobs(jobs)
     
-    def process_simple_data(self, data_dir="airbnb_data"):
+    def process_simple_data(self, data_dir="airbnb_data", date_folders=None):
         """Process reviews.csv and listings.csv to ia_simple database"""
         self.create_database_if_not_exists('ia_simple')
-        engine = create_engine(f"postgresql://{self.db_config['user']}:{self.db_config['password']}@{self.db_config['host']}:{self.db_config['port']}/ia_simple")
+        engine = self._engine_for('ia_simple')
         
-        data_path = Path(data_dir)
+        if date_folders is None:
+            date_folders = self.list_date_folders(data_dir)
         
-        for city_folder in data_path.iterdir():
-            if not city_folder.is_dir():
-                continue
-                
-            city_name = city_folder.name
-            self.create_schema_if_not_exists(engine, city_name)
+        city_names = sorted({date_folder.parent.name for date_folder in date_folders})
+        self.create_schemas_if_not_exist(engine, city_names)
+        existing = self.existing_tables(engine, city_names)
+        
+        jobs = []
+        for date_folder in date_folders:
+            city_name = date_folder.parent.name
+            date_str = date_folder.name.replace('-', '_')
             
-            for date_folder in city_folder.iterdir():
-                if not date_folder.is_dir():
-                    continue
+            # 只处理原始的 reviews.csv 和 listings.csv (不是 _detail 版本)
+            for filename in ['reviews.csv', 'listings.csv']:
+                csv_file = date_folder / filename
+                if csv_file.exists():
+                    data_type = csv_file.stem
+                    table_name = f"{data_type}_{date_str}"
                     
-                date_str = date_folder.name.replace('-', '_')
-                
-                # 只处理原始的 reviews.csv 和 listings.csv (不是 _detail 版本)
-                for filename in ['reviews.csv', 'listings.csv']:
-                    csv_file = date_folder / filename
-                    if csv_file.exists():
-                        data_type = csv_file.stem
-                        table_name = f"{data_type}_{date_str}"
-                        
-                        # 检查表是否已存在
-                        if self.table_exists(engine, city_name, table_name):
-                            print(f"Skipping {city_name}.{table_name} (already exists)")
-                            continue
-                        
-                        print(f"Loading {city_name}.{table_name}")
-                        
-                        try:
-                            df = pd.read_csv(csv_file, low_memory=False)
-                            
-                            # 特殊处理 listings 表
-                            if data_type == 'listings':
-                                df = self.process_listings_simple_dataframe(df)
-                                self.create_table_with_primary_key(engine, city_name, table_name, df, 'listing_id')
-                            else:
-                                # reviews 表正常处理
-                                df.to_sql(table_name, engine, schema=city_name, if_exists='fail', index=False)
-                                
-                        except Exception as e:
-                            print(f"Error loading {csv_file}: {e}")
+                    # 检查表是否已存在
+                    if (city_name, table_name) in existing:
+                        print(self._skip_message(existing, city_name, table_name))
+                        continue
+                    
+                    jobs.append(('ia_simple', csv_file, city_name, table_name, data_type, False, False))
+        
+        self.run_jobs(jobs)
     
-    def run(self, data_dir="airbnb_data", include_calendar=False, use_selected_detail=False):
+    def run(self, data_dir="airbnb_data", include_calendar=False, use_selected_detail=False, max_workers=None):
         """Run the complete process"""
-        print("Step 1: Decompressing .gz files...")
-        self.decompress_gz_files(data_dir)
+        if max_workers is not None:
+            self.max_workers = max_workers
         
-        selection_status = "selected columns" if use_selected_detail else "all columns"
-        print(f"\nStep 2: Loading detail data to ia_detail database (calendar: {'enabled' if include_calendar else 'disabled'}, columns: {selection_status})...")
-        self.process_detail_data(data_dir, include_calendar, use_selected_detail)
+        self._admin_conn = self._connect_admin()
         
-        print("\nStep 3: Loading simple data to ia_simple database...")
-        self.process_simple_data(data_dir)
+        try:
+            selection_status = "selected columns" if use_selected_detail else "all columns"
+            print(f"Step 1: Loading detail data to ia_detail database (calendar: {'enabled' if include_calendar else 'disabled'}, columns: {selection_status})...")
+            # 目录只遍历一次，两个步骤共用
+            date_folders = self.list_date_folders(data_dir)
+            self.process_detail_data(data_dir, include_calendar, use_selected_detail, date_folders)
+            
+            print("\nStep 2: Loading simple data to ia_simple database...")
+            self.process_simple_data(data_dir, date_folders)
+        finally:
+            self._admin_conn.close()
+            self._admin_conn = None
         
         print("\nDone!")
 
+# 工作进程里的 ToSQL 实例（engine 不能跨进程共享，每个进程各自缓存）
+_worker = None
+
+def _init_worker(db_config):
+    """Set up the ToSQL instance used by a worker process"""
+    global _worker
+    _worker = ToSQL(db_config['host'], db_config['user'], db_config['password'], db_config['port'])
+
+def _ingest_one(job):
+    """Load one (db, csv_file, schema, table, ...) job in a worker process"""
+    db_name, *args = job
+    _worker.ingest_file(_worker._engine_for(db_name), *args)
+
 # Create global instance
 _tosql = ToSQL()
 
-def tosql(db_host="localhost", db_user="postgres", db_password="", db_port=5432, data_dir="airbnb_data", include_calendar=False, selected_detail=False):
+def tosql(db_host="localhost", db_user="postgres", db_password="", db_port=5432, data_dir="airbnb_data", include_calendar=False, selected_detail=False, max_workers=None):
     """Import airbnb data to PostgreSQL"""
     
     processor = ToSQL(db_host, db_user, db_password, db_port)
-    processor.run(data_dir, include_calendar, selected_detail)
\ No newline at end of file
+    processor.run(data_dir, include_calendar, selected_detail, max_workers)
\ No newline at end of file
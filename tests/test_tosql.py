@@ -0,0 +1,53 @@
+import csv
+import io
+import unittest
+
+import pandas as pd
+
+from iacollector.tosql import copy_dataframe
+
+
+class _FakeCursor:
+    def __init__(self, sink):
+        self.sink = sink
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def copy_expert(self, query, buf):
+        self.sink.append(buf.read())
+
+
+class _FakeConnection:
+    """Stands in for a SQLAlchemy connection; records the data sent to COPY"""
+
+    def __init__(self):
+        self.copied = []
+        self.connection = self
+
+    def cursor(self):
+        return _FakeCursor(self.copied)
+
+
+class CopyDataFrameTest(unittest.TestCase):
+    def test_text_with_line_breaks_and_quotes_survives_copy_csv(self):
+        values = ['a\rb', 'x\ny', 'c\r\nd', '\\N', 'q"c,d', None]
+        df = pd.DataFrame({'listing_id': range(len(values)), 'comments': values})
+        conn = _FakeConnection()
+
+        copy_dataframe(conn, 'amsterdam', 'reviews_2025_06_09', df)
+
+        data = conn.copied[0]
+        # PostgreSQL 的 CSV COPY 不接受引号外的 \r 或 \n
+        for field in ('"a\rb"', '"x\ny"', '"c\r\nd"'):
+            self.assertIn(field, data)
+
+        rows = list(csv.reader(io.StringIO(data, newline='')))
+        self.assertEqual([row[1] for row in rows], ['a\rb', 'x\ny', 'c\r\nd', '\\N', 'q"c,d', ''])
+
+
+if __name__ == '__main__':
+    unittest.main()